@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, create_engine
+from sqlalchemy import Column, Integer, BigInteger, String, Text, JSON, DateTime, ForeignKey, Index, create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 import os
 from dotenv import load_dotenv
@@ -24,16 +24,72 @@ class WikiQuiz(Base):
     summary = Column(Text)
     key_entities = Column(JSON)  # Stores people, organizations, locations
     sections = Column(JSON)  # List of section titles
-    quiz = Column(JSON)  # List of quiz questions
+    quiz = Column(JSON)  # Default quiz, sampled from the question bank
     related_topics = Column(JSON)  # List of related topics
     raw_html = Column(Text, nullable=True)  # Bonus: store raw HTML
+    revision_id = Column(BigInteger, nullable=True)  # Wikipedia revision the quiz was built from
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the scraped article text
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # Last time the quiz was checked against Wikipedia
+    prefetched_at = Column(DateTime, nullable=True)  # Set if generated speculatively by the prefetcher
+    prefetch_hit_at = Column(DateTime, nullable=True)  # First user request for a prefetched quiz
+
+    questions = relationship("QuizQuestion", back_populates="wiki_quiz", cascade="all, delete-orphan")
+
+
+class QuizQuestion(Base):
+    """Database model for the per-article question bank quizzes are sampled from"""
+    __tablename__ = "quiz_questions"
+    __table_args__ = (
+        Index("ix_quiz_questions_bank", "wiki_quiz_id", "difficulty", "section"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    wiki_quiz_id = Column(Integer, ForeignKey("wiki_quizzes.id", ondelete="CASCADE"), nullable=False)
+    question = Column(Text, nullable=False)
+    options = Column(JSON, nullable=False)  # List of 4 options
+    answer = Column(Text, nullable=False)
+    difficulty = Column(String(16), nullable=False)  # easy, medium or hard
+    section = Column(String, nullable=False)  # Article section the question is about
+    explanation = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    wiki_quiz = relationship("WikiQuiz", back_populates="questions")
+
+    def to_dict(self) -> dict:
+        """Question in the format stored in WikiQuiz.quiz and returned by the API"""
+        return {
+            "id": self.id,
+            "question": self.question,
+            "options": self.options,
+            "answer": self.answer,
+            "difficulty": self.difficulty,
+            "section": self.section,
+            "explanation": self.explanation
+        }
 
 
 def init_db():
     """Initialize the database"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+
+def _add_missing_columns():
+    """
+    Add columns introduced after a table was first created
+    create_all() only creates missing tables, so older databases need this
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
 
 
 def get_db():
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Set
+
+from database import WikiQuiz, SessionLocal
+from scraper import WikipediaScraper, fetch_latest_revision_ids
+from pipeline import generate_quiz_content, apply_quiz_content
+from quiz_generator import QuizGenerator
+from question_bank import question_bank
+from llm_scheduler import PRIORITY_BACKGROUND
+
+
+class QuizRefresher:
+    """
+    Keeps cached quizzes in sync with the live Wikipedia articles
+
+    Stale quizzes are first checked against the latest revision id (one batched
+    API call), then against the hash of the scraped text, so the LLM only runs
+    for articles whose content actually changed.
+    """
+
+    def __init__(self):
+        self.stale_after = timedelta(hours=float(os.getenv("QUIZ_STALE_AFTER_HOURS", 24)))
+        self.interval = float(os.getenv("REFRESH_INTERVAL_SECONDS", 900))
+        self.batch_size = int(os.getenv("REFRESH_BATCH_SIZE", 50))
+
+        self._lock = threading.Lock()
+        self._in_flight = set()  # Quiz ids currently being refreshed
+        self._failed_at = {}  # Quiz id -> time of last failed refresh
+
+    def is_stale(self, quiz: WikiQuiz) -> bool:
+        """Check whether a quiz is due for a freshness check"""
+        last_checked = quiz.updated_at or quiz.created_at
+        return last_checked is None or datetime.utcnow() - last_checked > self.stale_after
+
+    def refresh_quiz(self, quiz_id: int) -> str:
+        """Refresh a single quiz (used for stale-while-revalidate on cache hits)"""
+        # A failing article would otherwise be re-scraped on every cache hit
+        if quiz_id in self._backoff_ids():
+            return 'skipped'
+
+        db = SessionLocal()
+        try:
+            quiz = db.query(WikiQuiz).filter(WikiQuiz.id == quiz_id).first()
+            if not quiz:
+                return 'missing'
+            return self._refresh(db, [quiz]).get(quiz.id, 'skipped')
+        finally:
+            db.close()
+
+    def refresh_stale(self) -> Dict[str, int]:
+        """
+        Refresh the least recently checked stale quizzes
+
+        Returns:
+            Count of quizzes per outcome (unchanged, regenerated, failed, skipped)
+        """
+        now = datetime.utcnow()
+        # Don't retry failing articles (e.g. deleted pages) on every cycle
+        backoff_ids = list(self._backoff_ids())
+
+        db = SessionLocal()
+        try:
+            query = db.query(WikiQuiz).filter(WikiQuiz.updated_at < now - self.stale_after)
+            if backoff_ids:
+                query = query.filter(~WikiQuiz.id.in_(backoff_ids))
+            quizzes = query.order_by(WikiQuiz.updated_at.asc()).limit(self.batch_size).all()
+
+            stats = {'unchanged': 0, 'regenerated': 0, 'failed': 0, 'skipped': 0}
+            for outcome in self._refresh(db, quizzes).values():
+                stats[outcome] += 1
+            return stats
+        finally:
+            db.close()
+
+    async def run_forever(self):
+        """Background loop that periodically refreshes stale quizzes"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                stats = await asyncio.to_thread(self.refresh_stale)
+                if stats['regenerated'] or stats['failed']:
+                    print(f"Quiz refresh: {stats}")
+            except Exception as e:
+                print(f"Error refreshing quizzes: {e}")
+
+    def _backoff_ids(self) -> Set[int]:
+        """Ids of quizzes whose last refresh failed less than stale_after ago"""
+        now = datetime.utcnow()
+        with self._lock:
+            self._failed_at = {
+                quiz_id: failed_at for quiz_id, failed_at in self._failed_at.items()
+                if now - failed_at < self.stale_after
+            }
+            return set(self._failed_at)
+
+    def _refresh(self, db, quizzes: List[WikiQuiz]) -> Dict[int, str]:
+        """Refresh the given quizzes, returning quiz id -> outcome"""
+        outcomes = {}
+        claimed = []
+        with self._lock:
+            for quiz in quizzes:
+                if quiz.id in self._in_flight:
+                    outcomes[quiz.id] = 'skipped'
+                else:
+                    self._in_flight.add(quiz.id)
+                    claimed.append(quiz)
+
+        try:
+            latest = fetch_latest_revision_ids([quiz.url for quiz in claimed]) if claimed else {}
+            for quiz in claimed:
+                try:
+                    outcomes[quiz.id] = self._refresh_one(db, quiz, latest.get(quiz.url))
+                except Exception as e:
+                    print(f"Error refreshing quiz {quiz.id}: {e}")
+                    db.rollback()
+                    outcomes[quiz.id] = 'failed'
+                    with self._lock:
+                        self._failed_at[quiz.id] = datetime.utcnow()
+        finally:
+            with self._lock:
+                for quiz in claimed:
+                    self._in_flight.discard(quiz.id)
+
+        return outcomes
+
+    def _refresh_one(self, db, quiz: WikiQuiz, latest_revision_id) -> str:
+        """Bring one quiz up to date with the article, regenerating only if needed"""
+        # Cheap check: the article has not been edited since the quiz was built
+        if latest_revision_id is not None and quiz.revision_id == latest_revision_id:
+            quiz.updated_at = datetime.utcnow()
+            db.commit()
+            return 'unchanged'
+
+        scraped_data = WikipediaScraper(quiz.url).scrape()
+
+        # A layout change or a broken page must not replace the quiz with one about nothing
+        if not scraped_data['full_text'].strip():
+            raise Exception(f"No article text found at {quiz.url}")
+
+        # Quizzes stored before revisions were tracked: hash the stored HTML instead
+        content_hash = quiz.content_hash
+        if content_hash is None and quiz.raw_html:
+            content_hash = WikipediaScraper(quiz.url).parse(quiz.raw_html)['content_hash']
+
+        # Edits that don't touch the article text (templates, references, ...)
+        if content_hash == scraped_data['content_hash']:
+            quiz.revision_id = scraped_data['revision_id']
+            quiz.content_hash = content_hash
+            quiz.updated_at = datetime.utcnow()
+            db.commit()
+            return 'unchanged'
+
+        print(f"Regenerating quiz {quiz.id}: {quiz.url}")
+        quiz_gen = QuizGenerator(priority=PRIORITY_BACKGROUND)
+        apply_quiz_content(db, quiz, generate_quiz_content(scraped_data, quiz_gen))
+        quiz.updated_at = datetime.utcnow()
+        db.commit()
+
+        # The new pool starts with one batch; fill it up like a new article
+        question_bank.top_up(quiz.id, question_bank.pool_size)
+        return 'regenerated'
+
+
+refresher = QuizRefresher()
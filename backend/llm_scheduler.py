@@ -0,0 +1,370 @@
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional
+
+
+# Lower values are served first
+PRIORITY_USER = 0  # A user is waiting for the response
+PRIORITY_BACKGROUND = 10  # Refreshes, question bank top-ups and prefetching
+
+
+class LLMSchedulerError(Exception):
+    """Base class for LLM calls the scheduler could not complete"""
+
+
+class SchedulerRejectedError(LLMSchedulerError):
+    """Call rejected before reaching the LLM (queue full or rate limit would exceed the deadline)"""
+
+
+class CircuitOpenError(LLMSchedulerError):
+    """Call rejected because the LLM has been failing consistently"""
+
+
+class LLMUnavailableError(LLMSchedulerError):
+    """Call failed with transient errors until retries or its deadline ran out"""
+
+
+TRANSIENT_ERROR_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'TimeoutError', 'ConnectionError'
+}
+# Only a leading status code counts: "400 ... exceeds the limit: 1500000 bytes" is permanent
+TRANSIENT_STATUS_PATTERN = re.compile(r'\s*(429|500|503|504)\b')
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Check whether an LLM error is worth retrying (rate limiting, overload, timeouts)"""
+    # google.api_core errors are matched by name (including base classes) so it isn't imported here
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return TRANSIENT_STATUS_PATTERN.match(str(error)) is not None
+
+
+class TokenBucket:
+    """Token bucket rate limiter (rate tokens per second, bursts of up to capacity)"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        Take one token, possibly ahead of time
+
+        Returns:
+            Seconds to wait before using the token, or None if that would exceed max_wait
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class LLMScheduler:
+    """
+    Shared gate for all LLM calls
+
+    - Adaptive concurrency (AIMD): the limit grows by ~1 per limit successes and
+      halves on rate limiting/overload, so we back off as soon as the quota pushes back
+    - Token bucket rate limiting on top of the concurrency limit
+    - Jittered exponential backoff retries for transient errors, within a per-call deadline
+    - Circuit breaker that fails fast after repeated transient errors, probing again
+      with a single call once the reset timeout has passed
+    - Waiting calls are served by priority, so user requests always go before
+      background work
+
+    Clock, sleep and randomness are injectable so the scheduler can be exercised
+    against a local fault-injecting stub instead of the real LLM.
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        initial_limit: int = 4,
+        rate_per_second: float = 1.0,
+        burst: int = 5,
+        max_queue: int = 50,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 20.0,
+        call_timeout: float = 90.0,
+        breaker_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+        is_transient: Callable[[Exception], bool] = is_transient_error,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.call_timeout = call_timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.is_transient = is_transient
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+
+        self.bucket = TokenBucket(rate_per_second, burst, clock)
+        # Calls hold their slot until the LLM call really returns, even after a
+        # timeout, so the pool never needs more threads than the maximum limit
+        self.executor = ThreadPoolExecutor(max_workers=max_limit, thread_name_prefix="llm")
+
+        self._cond = threading.Condition()
+        self._waiters = []  # Heap of (priority, ticket) for waiting calls
+        self._tickets = itertools.count()
+        self._in_flight = 0
+        self._last_decrease = float('-inf')
+        self._local = threading.local()  # Start time of the current thread's attempt
+
+        self._breaker_state = 'closed'  # closed, open or half_open
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self._counters = {
+            'calls': 0,
+            'successes': 0,
+            'errors': 0,
+            'transient_errors': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'rejected_queue_full': 0,
+            'rejected_rate_limited': 0,
+            'rejected_deadline': 0,
+            'rejected_circuit_open': 0
+        }
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        """Create a scheduler configured from environment variables"""
+        return cls(
+            min_limit=int(os.getenv("LLM_MIN_CONCURRENCY", 1)),
+            max_limit=int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+            initial_limit=int(os.getenv("LLM_INITIAL_CONCURRENCY", 4)),
+            rate_per_second=float(os.getenv("LLM_RATE_PER_MINUTE", 60)) / 60,
+            burst=int(os.getenv("LLM_BURST", 5)),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", 50)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", 3)),
+            call_timeout=float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", 90)),
+            breaker_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", 5)),
+            breaker_reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+        )
+
+    def call(self, fn: Callable, *args, priority: int = PRIORITY_USER, timeout: Optional[float] = None, **kwargs):
+        """
+        Run an LLM call through the scheduler
+
+        Args:
+            fn: Function performing the LLM call
+            priority: PRIORITY_USER or PRIORITY_BACKGROUND (lower is served first)
+            timeout: Deadline in seconds for the whole call, including queueing and retries
+            *args, **kwargs: Passed to fn
+
+        Returns:
+            Whatever fn returns
+
+        Raises:
+            SchedulerRejectedError, CircuitOpenError, LLMUnavailableError,
+            or the original exception for non-transient errors
+        """
+        deadline = self.clock() + (timeout if timeout is not None else self.call_timeout)
+        attempt = 0
+
+        while True:
+            probe = self._check_breaker()
+            try:
+                result = self._attempt(fn, args, kwargs, priority, deadline)
+            except LLMSchedulerError:
+                self._release_probe(probe)
+                raise
+            except Exception as e:
+                if not self.is_transient(e):
+                    self._count('errors')
+                    self._release_probe(probe)
+                    raise
+
+                self._on_transient_error(getattr(self._local, 'started', self.clock()))
+                delay = self._backoff_delay(attempt)
+                if attempt >= self.max_retries or self.clock() + delay >= deadline:
+                    raise LLMUnavailableError(f"LLM call failed after {attempt + 1} attempt(s): {e}") from e
+
+                attempt += 1
+                self._count('retries')
+                self.sleep(delay)
+                continue
+
+            self._on_success()
+            return result
+
+    def metrics(self) -> Dict:
+        """Snapshot of scheduler state and counters"""
+        with self._cond:
+            return {
+                'concurrency_limit': round(self.limit, 2),
+                'in_flight': self._in_flight,
+                'queue_depth': len(self._waiters),
+                'circuit_state': self._breaker_state,
+                **self._counters
+            }
+
+    def has_idle_capacity(self) -> bool:
+        """Check whether a new call would start right away without delaying anyone"""
+        with self._cond:
+            return (
+                not self._waiters
+                and self._in_flight < int(self.limit)
+                and self._breaker_state == 'closed'
+            )
+
+    def retry_after(self) -> int:
+        """Seconds a client should wait before retrying a rejected request"""
+        with self._cond:
+            if self._breaker_state == 'open':
+                remaining = self._opened_at + self.breaker_reset_timeout - self.clock()
+                return max(1, int(remaining + 0.999))
+        return max(1, int(1 / self.bucket.rate + 0.999))
+
+    def _attempt(self, fn: Callable, args, kwargs, priority: int, deadline: float):
+        """Acquire a slot and a rate token, then run one attempt before the deadline"""
+        self._acquire_slot(priority, deadline)
+        slot_handed_off = False
+        try:
+            wait = self.bucket.reserve(max_wait=deadline - self.clock())
+            if wait is None:
+                self._count('rejected_rate_limited')
+                raise SchedulerRejectedError("LLM rate limit would exceed the call deadline")
+            if wait > 0:
+                self.sleep(wait)
+
+            self._count('calls')
+            self._local.started = self.clock()
+            future = self.executor.submit(fn, *args, **kwargs)
+            future.add_done_callback(lambda _: self._release_slot())
+            slot_handed_off = True
+
+            try:
+                return future.result(timeout=max(0.0, deadline - self.clock()))
+            except FutureTimeoutError:
+                self._count('timeouts')
+                raise TimeoutError("LLM call exceeded its deadline")
+        finally:
+            if not slot_handed_off:
+                self._release_slot()
+
+    def _acquire_slot(self, priority: int, deadline: float):
+        """Wait for a free concurrency slot, serving waiters by priority, then in order"""
+        with self._cond:
+            must_wait = self._waiters or self._in_flight >= int(self.limit)
+            if must_wait and len(self._waiters) >= self.max_queue:
+                self._counters['rejected_queue_full'] += 1
+                raise SchedulerRejectedError("Too many LLM calls waiting")
+
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while not (self._waiters[0] == ticket and self._in_flight < int(self.limit)):
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        self._counters['rejected_deadline'] += 1
+                        raise SchedulerRejectedError("Deadline passed while waiting for an LLM slot")
+                    self._cond.wait(timeout=remaining)
+                self._in_flight += 1
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def _release_slot(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _check_breaker(self) -> bool:
+        """
+        Fail fast while the circuit is open
+
+        Returns:
+            True if this call is the single probe allowed through a half-open circuit
+        """
+        with self._cond:
+            if self._breaker_state == 'open':
+                if self.clock() - self._opened_at < self.breaker_reset_timeout:
+                    self._counters['rejected_circuit_open'] += 1
+                    raise CircuitOpenError("LLM circuit breaker is open")
+                self._breaker_state = 'half_open'
+
+            if self._breaker_state == 'half_open':
+                if self._probe_in_flight:
+                    self._counters['rejected_circuit_open'] += 1
+                    raise CircuitOpenError("LLM circuit breaker is half-open, probe in progress")
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def _release_probe(self, probe: bool):
+        """Let another probe through after one ended without a verdict"""
+        if probe:
+            with self._cond:
+                self._probe_in_flight = False
+
+    def _on_success(self):
+        with self._cond:
+            self._counters['successes'] += 1
+            self._consecutive_failures = 0
+            self._breaker_state = 'closed'
+            self._probe_in_flight = False
+            # Additive increase: roughly +1 per limit successful calls
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _on_transient_error(self, started: float):
+        with self._cond:
+            self._counters['transient_errors'] += 1
+            self._consecutive_failures += 1
+
+            # Multiplicative decrease, only once per window of concurrent calls:
+            # calls started before the last decrease ran under the old limit
+            now = self.clock()
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._last_decrease = now
+
+            if self._breaker_state == 'half_open' or self._consecutive_failures >= self.breaker_threshold:
+                self._breaker_state = 'open'
+                self._opened_at = now
+            self._probe_in_flight = False
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return self.rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _count(self, counter: str):
+        with self._cond:
+            self._counters[counter] += 1
+
+
+# Shared by every QuizGenerator so all LLM traffic goes through one limit
+llm_scheduler = LLMScheduler.from_env()
@@ -1,14 +1,20 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, Field
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
+import asyncio
 import os
 from dotenv import load_dotenv
 
 from database import WikiQuiz, init_db, get_db
 from scraper import WikipediaScraper, validate_wikipedia_url
-from quiz_generator import QuizGenerator
+from pipeline import generate_quiz_content, apply_quiz_content
+from question_bank import question_bank
+from llm_scheduler import LLMSchedulerError, llm_scheduler
+from prefetcher import prefetcher
+from freshness import refresher
 
 load_dotenv()
 
@@ -34,12 +40,25 @@ async def startup_event():
     init_db()
     print("Database initialized successfully!")
 
+    # Periodically re-check cached quizzes against Wikipedia
+    if refresher.interval > 0:
+        app.state.refresh_task = asyncio.create_task(refresher.run_forever())
+
+    # Optionally pre-generate quizzes for related topics while the LLM is idle
+    if prefetcher.enabled:
+        app.state.prefetch_task = asyncio.create_task(prefetcher.run_forever())
+
 
 # Pydantic models for request/response
 class QuizGenerateRequest(BaseModel):
     url: str
 
 
+class QuizSampleRequest(BaseModel):
+    size: Optional[int] = Field(default=None, ge=1, le=50)  # Defaults to QUIZ_SIZE
+    seen_question_ids: List[int] = []
+
+
 class QuizResponse(BaseModel):
     id: int
     url: str
@@ -50,6 +69,7 @@ class QuizResponse(BaseModel):
     quiz: List[dict]
     related_topics: List[str]
     created_at: str
+    updated_at: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -65,6 +85,22 @@ class QuizHistoryItem(BaseModel):
         from_attributes = True
 
 
+def to_quiz_response(quiz: WikiQuiz, questions: Optional[List[dict]] = None) -> QuizResponse:
+    """Build the API response for a stored quiz (optionally with sampled questions)"""
+    return QuizResponse(
+        id=quiz.id,
+        url=quiz.url,
+        title=quiz.title,
+        summary=quiz.summary,
+        key_entities=quiz.key_entities,
+        sections=quiz.sections,
+        quiz=questions if questions is not None else quiz.quiz,
+        related_topics=quiz.related_topics,
+        created_at=quiz.created_at.isoformat(),
+        updated_at=quiz.updated_at.isoformat() if quiz.updated_at else None
+    )
+
+
 # API Endpoints
 
 @app.get("/")
@@ -76,14 +112,19 @@ async def root():
         "endpoints": {
             "generate_quiz": "/api/quiz/generate",
             "get_all_quizzes": "/api/quiz/history",
-            "get_quiz_by_id": "/api/quiz/{quiz_id}"
+            "get_quiz_by_id": "/api/quiz/{quiz_id}",
+            "sample_quiz": "/api/quiz/{quiz_id}/sample",
+            "metrics": "/api/metrics"
         }
     }
 
 
+# Plain def: FastAPI runs it in its threadpool, so scraping and waiting on
+# the LLM scheduler (slots, rate limit, retry backoff) never block the event loop
 @app.post("/api/quiz/generate", response_model=QuizResponse)
-async def generate_quiz(
+def generate_quiz(
     request: QuizGenerateRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -91,7 +132,7 @@ async def generate_quiz(
     
     Steps:
     1. Validate URL
-    2. Check if already in database (caching)
+    2. Check if already in database (caching, stale entries refreshed in background)
     3. Scrape Wikipedia article
     4. Generate quiz using LLM
     5. Store in database
@@ -108,75 +149,52 @@ async def generate_quiz(
     
     try:
         # Check cache - if URL already processed, return cached result
+        # Stale entries are still served immediately and revalidated in the background
         existing_quiz = db.query(WikiQuiz).filter(WikiQuiz.url == url).first()
         if existing_quiz:
-            return QuizResponse(
-                id=existing_quiz.id,
-                url=existing_quiz.url,
-                title=existing_quiz.title,
-                summary=existing_quiz.summary,
-                key_entities=existing_quiz.key_entities,
-                sections=existing_quiz.sections,
-                quiz=existing_quiz.quiz,
-                related_topics=existing_quiz.related_topics,
-                created_at=existing_quiz.created_at.isoformat()
-            )
+            if refresher.is_stale(existing_quiz):
+                background_tasks.add_task(refresher.refresh_quiz, existing_quiz.id)
+            prefetcher.record_hit(db, existing_quiz)
+            return to_quiz_response(existing_quiz)
         
         # Step 1: Scrape Wikipedia
         print(f"Scraping Wikipedia: {url}")
         scraper = WikipediaScraper(url)
         scraped_data = scraper.scrape()
         
-        # Step 2: Generate quiz using LLM
-        print("Generating quiz with LLM...")
-        quiz_gen = QuizGenerator()
-        
-        quiz_questions = quiz_gen.generate_quiz(
-            title=scraped_data['title'],
-            content=scraped_data['full_text'],
-            num_questions=7  # Generate 7 questions
-        )
-        
-        # Step 3: Generate related topics
-        print("Generating related topics...")
-        related_topics = quiz_gen.generate_related_topics(
-            title=scraped_data['title'],
-            summary=scraped_data['summary'],
-            sections=scraped_data['sections']
-        )
+        # Step 2: Generate question bank and related topics using LLM
+        quiz_content = generate_quiz_content(scraped_data)
         
-        # Step 4: Store in database
+        # Step 3: Store in database (default quiz is sampled from the bank)
         print("Storing in database...")
-        db_quiz = WikiQuiz(
-            url=url,
-            title=scraped_data['title'],
-            summary=scraped_data['summary'],
-            key_entities=scraped_data['key_entities'],
-            sections=scraped_data['sections'],
-            quiz=quiz_questions,
-            related_topics=related_topics,
-            raw_html=scraped_data['raw_html']  # Bonus: store raw HTML
-        )
-        
-        db.add(db_quiz)
-        db.commit()
+        db_quiz = WikiQuiz(url=url)
+        try:
+            apply_quiz_content(db, db_quiz, quiz_content)
+            db.commit()
+        except IntegrityError:
+            # Generated concurrently (e.g. by the prefetcher) - serve that one
+            db.rollback()
+            return to_quiz_response(db.query(WikiQuiz).filter(WikiQuiz.url == url).one())
         db.refresh(db_quiz)
         
         print(f"Quiz generated successfully! ID: {db_quiz.id}")
         
+        # Fill the question bank beyond the first batch without making the user wait
+        background_tasks.add_task(question_bank.top_up, db_quiz.id, question_bank.pool_size)
+        
+        # Users often open a related topic next
+        background_tasks.add_task(prefetcher.schedule_related, db_quiz.related_topics)
+        
         # Return response
-        return QuizResponse(
-            id=db_quiz.id,
-            url=db_quiz.url,
-            title=db_quiz.title,
-            summary=db_quiz.summary,
-            key_entities=db_quiz.key_entities,
-            sections=db_quiz.sections,
-            quiz=db_quiz.quiz,
-            related_topics=db_quiz.related_topics,
-            created_at=db_quiz.created_at.isoformat()
-        )
+        return to_quiz_response(db_quiz)
         
+    except LLMSchedulerError as e:
+        print(f"LLM unavailable: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Quiz generation is temporarily unavailable, please retry shortly: {str(e)}",
+            headers={"Retry-After": str(llm_scheduler.retry_after())}
+        )
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(
@@ -185,6 +203,15 @@ async def generate_quiz(
         )
 
 
+@app.get("/api/metrics")
+async def get_metrics(db: Session = Depends(get_db)):
+    """Operational metrics (LLM queue depth and rejections, prefetch budget and hit rate)"""
+    return {
+        "llm": llm_scheduler.metrics(),
+        "prefetch": prefetcher.metrics(db)
+    }
+
+
 @app.get("/api/quiz/history", response_model=List[QuizHistoryItem])
 async def get_quiz_history(db: Session = Depends(get_db)):
     """
@@ -221,17 +248,7 @@ async def get_quiz_by_id(quiz_id: int, db: Session = Depends(get_db)):
         if not quiz:
             raise HTTPException(status_code=404, detail="Quiz not found")
         
-        return QuizResponse(
-            id=quiz.id,
-            url=quiz.url,
-            title=quiz.title,
-            summary=quiz.summary,
-            key_entities=quiz.key_entities,
-            sections=quiz.sections,
-            quiz=quiz.quiz,
-            related_topics=quiz.related_topics,
-            created_at=quiz.created_at.isoformat()
-        )
+        return to_quiz_response(quiz)
     except HTTPException:
         raise
     except Exception as e:
@@ -241,6 +258,41 @@ async def get_quiz_by_id(quiz_id: int, db: Session = Depends(get_db)):
         )
 
 
+@app.post("/api/quiz/{quiz_id}/sample", response_model=QuizResponse)
+async def sample_quiz(
+    quiz_id: int,
+    request: QuizSampleRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Get a different quiz on the same article, sampled from its question bank
+    Questions listed in seen_question_ids are avoided while unseen ones remain
+    """
+    try:
+        quiz = db.query(WikiQuiz).filter(WikiQuiz.id == quiz_id).first()
+        
+        if not quiz:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        
+        question_bank.ensure_pool(db, quiz)
+        questions = question_bank.sample(db, quiz, request.size, request.seen_question_ids)
+        
+        # Generate more questions in the background only when the pool runs low
+        seen_ids = set(request.seen_question_ids) | {q['id'] for q in questions}
+        if question_bank.needs_top_up(db, quiz, seen_ids):
+            background_tasks.add_task(question_bank.top_up, quiz.id)
+        
+        return to_quiz_response(quiz, questions)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error sampling quiz: {str(e)}"
+        )
+
+
 @app.delete("/api/quiz/{quiz_id}")
 async def delete_quiz(quiz_id: int, db: Session = Depends(get_db)):
     """Delete a quiz by ID (optional endpoint)"""
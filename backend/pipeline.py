@@ -0,0 +1,67 @@
+from typing import Dict, Optional
+
+from database import WikiQuiz
+from quiz_generator import QuizGenerator
+from question_bank import question_bank
+
+
+def generate_quiz_content(scraped_data: Dict, quiz_gen: Optional[QuizGenerator] = None) -> Dict:
+    """
+    Run the LLM steps on scraped article data
+
+    Args:
+        scraped_data: Output of WikipediaScraper.scrape()
+        quiz_gen: Generator to reuse (a new one is created if omitted)
+
+    Returns:
+        Dictionary of WikiQuiz column values, plus the first batch of the
+        question pool (the rest is generated by QuestionBank.top_up)
+    """
+    quiz_gen = quiz_gen or QuizGenerator()
+
+    # Step 1: Generate the first batch of the question bank using LLM
+    print("Generating quiz with LLM...")
+    questions = quiz_gen.generate_quiz(
+        title=scraped_data['title'],
+        content=scraped_data['full_text'],
+        num_questions=question_bank.first_batch_size,
+        sections=scraped_data['sections'],
+        allow_fallback=False  # A placeholder must never replace a real pool
+    )
+
+    # Step 2: Generate related topics
+    print("Generating related topics...")
+    related_topics = quiz_gen.generate_related_topics(
+        title=scraped_data['title'],
+        summary=scraped_data['summary'],
+        sections=scraped_data['sections']
+    )
+
+    return {
+        'title': scraped_data['title'],
+        'summary': scraped_data['summary'],
+        'key_entities': scraped_data['key_entities'],
+        'sections': scraped_data['sections'],
+        'questions': questions,
+        'related_topics': related_topics,
+        'raw_html': scraped_data['raw_html'],  # Bonus: store raw HTML
+        'revision_id': scraped_data['revision_id'],
+        'content_hash': scraped_data['content_hash']
+    }
+
+
+def apply_quiz_content(db, quiz: WikiQuiz, content: Dict):
+    """
+    Write generated content to a quiz, rebuild its question bank and
+    sample the default quiz from it (the caller commits)
+    """
+    content = dict(content)
+    questions = content.pop('questions')
+    for column, value in content.items():
+        setattr(quiz, column, value)
+
+    if quiz.id is None:
+        db.add(quiz)
+        db.flush()
+
+    question_bank.replace_questions(db, quiz, questions)
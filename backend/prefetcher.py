@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import WikiQuiz, SessionLocal
+from scraper import WikipediaScraper, article_url, resolve_article_titles, validate_wikipedia_url
+from pipeline import generate_quiz_content, apply_quiz_content
+from quiz_generator import QuizGenerator
+from llm_scheduler import PRIORITY_BACKGROUND, llm_scheduler
+
+
+class Prefetcher:
+    """
+    Speculatively generates quizzes for the related topics of new quizzes
+
+    Users often open a suggested related topic next, so generating it ahead of
+    time turns a multi-second cold start into a cache hit. Prefetching only
+    runs while the LLM scheduler has idle capacity, at background priority,
+    and within an hourly budget. Hit rate is tracked in the database.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+        self.max_per_hour = int(os.getenv("PREFETCH_MAX_PER_HOUR", 20))
+        self.topics_per_quiz = int(os.getenv("PREFETCH_TOPICS_PER_QUIZ", 3))
+        self.max_queue = int(os.getenv("PREFETCH_MAX_QUEUE", 100))
+        self.poll_interval = float(os.getenv("PREFETCH_POLL_SECONDS", 5))
+
+        self._lock = threading.Lock()
+        self._queue = []  # Heap of (priority, seq, url)
+        self._queued = set()  # Urls in the queue or being prefetched
+        self._batches = itertools.count()
+        self._seq = itertools.count()
+        self._started = deque()  # Start times of prefetches in the last hour
+
+        self._counters = {
+            'scheduled': 0,
+            'started': 0,
+            'completed': 0,
+            'failed': 0,
+            'skipped_existing': 0,
+            'skipped_unresolved': 0,
+            'dropped_queue_full': 0,
+            'deferred_busy': 0,
+            'deferred_budget': 0
+        }
+
+    def schedule_related(self, related_topics: List[str]):
+        """
+        Queue the related topics of a newly generated quiz (run as a background task)
+        Topics are resolved to articles first, so missing and disambiguation pages are skipped
+        """
+        if not self.enabled or not related_topics:
+            return
+
+        topics = related_topics[:self.topics_per_quiz]
+        resolved = resolve_article_titles(topics)
+
+        # Store under the URL a click on the topic produces, so the click is a cache hit
+        candidates = []
+        for topic in topics:
+            url = article_url(topic)
+            if resolved.get(topic) is None or not validate_wikipedia_url(url):
+                self._count('skipped_unresolved')
+                continue
+            candidates.append((url, article_url(resolved[topic])))
+
+        db = SessionLocal()
+        try:
+            known = {
+                url for (url,) in
+                db.query(WikiQuiz.url).filter(WikiQuiz.url.in_([u for pair in candidates for u in pair]))
+            }
+        finally:
+            db.close()
+
+        # Newer quizzes first, then in the order the LLM ranked their topics
+        batch = -next(self._batches)
+        with self._lock:
+            for rank, (url, canonical_url) in enumerate(candidates):
+                if url in known or canonical_url in known or url in self._queued:
+                    self._counters['skipped_existing'] += 1
+                    continue
+                heapq.heappush(self._queue, ((batch, rank), next(self._seq), url))
+                self._queued.add(url)
+                self._counters['scheduled'] += 1
+
+            # Drop the least relevant entries when the queue is full
+            while len(self._queue) > self.max_queue:
+                dropped = max(self._queue)
+                self._queue.remove(dropped)
+                self._queued.discard(dropped[2])
+                self._counters['dropped_queue_full'] += 1
+            heapq.heapify(self._queue)
+
+    def record_hit(self, db, quiz: WikiQuiz):
+        """Mark a prefetched quiz as used by a real request (first request only)"""
+        if quiz.prefetched_at is None or quiz.prefetch_hit_at is not None:
+            return
+        quiz.prefetch_hit_at = datetime.utcnow()
+        db.commit()
+
+    async def run_forever(self):
+        """Background loop that prefetches queued topics while the LLM is idle"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            url = self._next_url()
+            if url is None:
+                continue
+            try:
+                await asyncio.to_thread(self.prefetch, url)
+            except Exception as e:
+                print(f"Error prefetching {url}: {e}")
+
+    def prefetch(self, url: str) -> bool:
+        """Generate and store the quiz for one URL at background priority"""
+        db = SessionLocal()
+        try:
+            if db.query(WikiQuiz.id).filter(WikiQuiz.url == url).first():
+                self._count('skipped_existing')
+                return False
+
+            # Only charge the budget once the LLM is actually going to be used
+            self._charge_budget()
+            print(f"Prefetching: {url}")
+            scraped_data = WikipediaScraper(url).scrape()
+            quiz_gen = QuizGenerator(priority=PRIORITY_BACKGROUND)
+            quiz_content = generate_quiz_content(scraped_data, quiz_gen)
+
+            # Only the first batch: the pool is topped up if the quiz is actually used
+            db_quiz = WikiQuiz(url=url, prefetched_at=datetime.utcnow())
+            apply_quiz_content(db, db_quiz, quiz_content)
+            db.commit()
+            self._count('completed')
+            return True
+        except IntegrityError:
+            # A user request generated the same article in the meantime
+            db.rollback()
+            self._count('skipped_existing')
+            return False
+        except Exception:
+            db.rollback()
+            self._count('failed')
+            raise
+        finally:
+            db.close()
+            with self._lock:
+                self._queued.discard(url)
+
+    def metrics(self, db) -> Dict:
+        """Queue, budget and hit-rate metrics"""
+        prefetched, hits = db.query(
+            func.count(WikiQuiz.prefetched_at), func.count(WikiQuiz.prefetch_hit_at)
+        ).filter(WikiQuiz.prefetched_at.isnot(None)).one()
+
+        with self._lock:
+            self._trim_budget_window()
+            return {
+                'enabled': self.enabled,
+                'queue_depth': len(self._queue),
+                'budget_per_hour': self.max_per_hour,
+                'budget_remaining': max(0, self.max_per_hour - len(self._started)),
+                'prefetched_quizzes': prefetched,
+                'hits': hits,
+                'hit_rate': round(hits / prefetched, 3) if prefetched else None,
+                **self._counters
+            }
+
+    def _next_url(self):
+        """Pop the next URL if there is idle LLM capacity and budget left"""
+        with self._lock:
+            if not self._queue:
+                return None
+
+            # Real user requests always go first
+            if not llm_scheduler.has_idle_capacity():
+                self._counters['deferred_busy'] += 1
+                return None
+
+            self._trim_budget_window()
+            if len(self._started) >= self.max_per_hour:
+                self._counters['deferred_budget'] += 1
+                return None
+
+            _, _, url = heapq.heappop(self._queue)
+            return url
+
+    def _charge_budget(self):
+        with self._lock:
+            self._started.append(time.monotonic())
+            self._counters['started'] += 1
+
+    def _trim_budget_window(self):
+        cutoff = time.monotonic() - 3600
+        while self._started and self._started[0] < cutoff:
+            self._started.popleft()
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,234 @@
+import os
+import random
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from database import WikiQuiz, QuizQuestion, SessionLocal
+from scraper import WikipediaScraper
+from quiz_generator import QuizGenerator
+from llm_scheduler import PRIORITY_BACKGROUND
+
+
+DIFFICULTY_ORDER = ['easy', 'medium', 'hard']
+
+# gemini-pro stops at 2,048 output tokens and each question is ~125 tokens of
+# JSON, so asking for more than this in one call returns truncated JSON
+MAX_QUESTIONS_PER_CALL = 12
+
+
+class QuestionBank:
+    """
+    Per-article pool of quiz questions
+
+    A new article gets one quiz-sized batch on the request path; the pool is
+    then filled up to QUESTION_BANK_SIZE in the background, in batches that fit
+    the LLM's output limit. Quizzes are sampled from the pool, and it is only
+    topped up further when a user is running out of questions they have not seen.
+    """
+
+    def __init__(self):
+        self.quiz_size = int(os.getenv("QUIZ_SIZE", 7))
+        self.pool_size = int(os.getenv("QUESTION_BANK_SIZE", 30))
+        self.first_batch_size = min(self.quiz_size, MAX_QUESTIONS_PER_CALL)
+        self.top_up_size = min(int(os.getenv("QUESTION_BANK_TOP_UP_SIZE", 10)), MAX_QUESTIONS_PER_CALL)
+        self.low_water = int(os.getenv("QUESTION_BANK_LOW_WATER", 14))
+        self.max_size = int(os.getenv("QUESTION_BANK_MAX_SIZE", 120))
+
+        self._lock = threading.Lock()
+        self._topping_up = set()  # Quiz ids with a top-up in progress
+
+    def replace_questions(self, db, quiz: WikiQuiz, questions: List[Dict]):
+        """Replace the whole pool (new article or article content changed)"""
+        if not questions:
+            raise ValueError("Refusing to replace the question bank with an empty pool")
+        db.query(QuizQuestion).filter(QuizQuestion.wiki_quiz_id == quiz.id).delete()
+        self.add_questions(db, quiz, questions)
+        quiz.quiz = self.sample(db, quiz)
+
+    def add_questions(self, db, quiz: WikiQuiz, questions: Iterable[Dict]) -> List[QuizQuestion]:
+        """Store generated questions in the pool, skipping duplicates"""
+        existing = {
+            text.strip().lower() for (text,) in
+            db.query(QuizQuestion.question).filter(QuizQuestion.wiki_quiz_id == quiz.id)
+        }
+
+        added = []
+        for q in questions:
+            key = q['question'].strip().lower()
+            if key in existing:
+                continue
+            existing.add(key)
+            added.append(QuizQuestion(
+                wiki_quiz_id=quiz.id,
+                question=q['question'],
+                options=q['options'],
+                answer=q['answer'],
+                difficulty=q.get('difficulty', 'medium'),
+                section=q.get('section') or 'General',
+                explanation=q.get('explanation')
+            ))
+
+        db.add_all(added)
+        db.flush()
+        return added
+
+    def ensure_pool(self, db, quiz: WikiQuiz):
+        """Seed the pool from the stored quiz for articles generated before the bank existed"""
+        if quiz.quiz and not db.query(QuizQuestion.id).filter(QuizQuestion.wiki_quiz_id == quiz.id).first():
+            self.add_questions(db, quiz, quiz.quiz)
+            quiz.quiz = self.sample(db, quiz)
+            db.commit()
+
+    def sample(
+        self,
+        db,
+        quiz: WikiQuiz,
+        size: Optional[int] = None,
+        seen_ids: Optional[Iterable[int]] = None,
+        rng: Optional[random.Random] = None
+    ) -> List[Dict]:
+        """
+        Build a quiz by sampling the pool
+
+        Questions are stratified by difficulty and, within each difficulty, by
+        section. Unseen questions are always preferred; seen ones are only
+        used to fill up the quiz when the pool runs out.
+
+        Args:
+            quiz: Article to sample from
+            size: Number of questions (default QUIZ_SIZE)
+            seen_ids: Ids of questions the user has already answered
+            rng: Random generator (for reproducible sampling)
+
+        Returns:
+            List of question dictionaries, ordered from easy to hard
+        """
+        size = size or self.quiz_size
+        seen_ids = set(seen_ids or [])
+        rng = rng or random
+
+        pool = db.query(QuizQuestion).filter(QuizQuestion.wiki_quiz_id == quiz.id).all()
+        unseen = [q for q in pool if q.id not in seen_ids]
+        seen = [q for q in pool if q.id in seen_ids]
+
+        picked = self._stratified_pick(unseen, size, rng)
+        if len(picked) < size:
+            picked += self._stratified_pick(seen, size - len(picked), rng)
+
+        picked.sort(key=lambda q: self._difficulty_rank(q.difficulty))
+        return [q.to_dict() for q in picked]
+
+    def needs_top_up(self, db, quiz: WikiQuiz, seen_ids: Optional[Iterable[int]] = None) -> bool:
+        """Check whether the user is running low on unseen questions"""
+        seen_ids = set(seen_ids or [])
+        pool_ids = [
+            question_id for (question_id,) in
+            db.query(QuizQuestion.id).filter(QuizQuestion.wiki_quiz_id == quiz.id)
+        ]
+        unseen = sum(1 for question_id in pool_ids if question_id not in seen_ids)
+        return unseen < self.low_water and len(pool_ids) < self.max_size
+
+    def top_up(self, quiz_id: int, target: Optional[int] = None) -> int:
+        """
+        Generate more questions for an article (run as a background task)
+
+        Args:
+            quiz_id: Article to generate questions for
+            target: Keep adding batches until the pool has this many questions
+                (default: a single batch)
+
+        Returns:
+            Number of questions added
+        """
+        with self._lock:
+            if quiz_id in self._topping_up:
+                return 0
+            self._topping_up.add(quiz_id)
+
+        db = SessionLocal()
+        try:
+            quiz = db.query(WikiQuiz).filter(WikiQuiz.id == quiz_id).first()
+            if not quiz:
+                return 0
+
+            # The stored HTML avoids a network round trip to Wikipedia
+            scraper = WikipediaScraper(quiz.url)
+            scraped_data = scraper.parse(quiz.raw_html) if quiz.raw_html else scraper.scrape()
+
+            quiz_gen = QuizGenerator(priority=PRIORITY_BACKGROUND)
+            total_added = 0
+            while True:
+                existing = [
+                    text for (text,) in
+                    db.query(QuizQuestion.question).filter(QuizQuestion.wiki_quiz_id == quiz.id)
+                ]
+                if len(existing) >= self.max_size:
+                    break
+
+                print(f"Topping up question bank for quiz {quiz.id} ({len(existing)} questions)")
+                questions = quiz_gen.generate_quiz(
+                    title=scraped_data['title'],
+                    content=scraped_data['full_text'],
+                    num_questions=self.top_up_size,
+                    sections=scraped_data['sections'],
+                    exclude=existing,
+                    allow_fallback=False
+                )
+
+                added = self.add_questions(db, quiz, questions)
+                db.commit()
+                total_added += len(added)
+
+                # Stop once the target is reached, or when the LLM only repeats itself
+                if target is None or not added or len(existing) + len(added) >= target:
+                    break
+            return total_added
+        except Exception as e:
+            print(f"Error topping up question bank for quiz {quiz_id}: {e}")
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+            with self._lock:
+                self._topping_up.discard(quiz_id)
+
+    def _stratified_pick(self, questions: List[QuizQuestion], size: int, rng) -> List[QuizQuestion]:
+        """Round-robin over difficulties, and over sections within each difficulty"""
+        strata = defaultdict(lambda: defaultdict(list))
+        for q in questions:
+            strata[q.difficulty][q.section].append(q)
+
+        # Shuffle within each stratum and rotate sections per difficulty
+        rotations = {}
+        for difficulty, by_section in strata.items():
+            buckets = list(by_section.values())
+            for bucket in buckets:
+                rng.shuffle(bucket)
+            rng.shuffle(buckets)
+            rotations[difficulty] = buckets
+
+        picked = []
+        difficulties = sorted(rotations, key=self._difficulty_rank)
+        while len(picked) < size and difficulties:
+            for difficulty in list(difficulties):
+                if len(picked) >= size:
+                    break
+                buckets = rotations[difficulty]
+                bucket = buckets.pop(0)
+                picked.append(bucket.pop())
+                if bucket:
+                    buckets.append(bucket)
+                if not buckets:
+                    difficulties.remove(difficulty)
+
+        return picked
+
+    @staticmethod
+    def _difficulty_rank(difficulty: str) -> int:
+        if difficulty in DIFFICULTY_ORDER:
+            return DIFFICULTY_ORDER.index(difficulty)
+        return len(DIFFICULTY_ORDER)
+
+
+question_bank = QuestionBank()
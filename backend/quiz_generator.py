@@ -3,27 +3,45 @@ from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 import json
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
+from llm_scheduler import LLMScheduler, LLMSchedulerError, PRIORITY_USER, llm_scheduler
+
 load_dotenv()
 
 
+class QuizGenerationError(Exception):
+    """The LLM response contained no usable questions"""
+
+
 class QuizGenerator:
     """Generates quiz questions using LLM from Wikipedia article content"""
 
-    def __init__(self):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        
-        # Initialize Gemini LLM
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-pro",
-            google_api_key=api_key,
-            temperature=0.7,
-            convert_system_message_to_human=True
-        )
+    def __init__(self, llm=None, scheduler: Optional[LLMScheduler] = None, priority: int = PRIORITY_USER):
+        """
+        Args:
+            llm: LangChain model to use instead of Gemini (e.g. a local stub)
+            scheduler: Scheduler for LLM calls (defaults to the shared one)
+            priority: Scheduler priority (PRIORITY_BACKGROUND for work nobody waits on)
+        """
+        # All LLM calls share one concurrency/rate limit and circuit breaker
+        self.scheduler = scheduler or llm_scheduler
+        self.priority = priority
+
+        if llm is None:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY not found in environment variables")
+            
+            # Initialize Gemini LLM
+            llm = ChatGoogleGenerativeAI(
+                model="gemini-pro",
+                google_api_key=api_key,
+                temperature=0.7,
+                convert_system_message_to_human=True
+            )
+        self.llm = llm
 
         # Define prompt templates
         self.quiz_prompt = self._create_quiz_prompt()
@@ -41,9 +59,15 @@ ARTICLE TITLE: {title}
 ARTICLE CONTENT:
 {content}
 
+ARTICLE SECTIONS:
+{sections}
+
+EXISTING QUESTIONS (do not repeat or rephrase these):
+{existing_questions}
+
 INSTRUCTIONS:
 1. Create exactly {num_questions} multiple-choice questions based ONLY on the information in the article above
-2. Questions should cover different aspects and sections of the article
+2. Questions should cover different aspects and sections of the article, spread across the sections listed above
 3. Include a mix of difficulty levels: easy (basic facts), medium (understanding), and hard (deeper analysis)
 4. Each question must have:
    - A clear, specific question
@@ -51,6 +75,7 @@ INSTRUCTIONS:
    - The correct answer (must be one of the four options)
    - A brief explanation citing which part of the article contains the answer
    - A difficulty level (easy, medium, or hard)
+   - The article section the question is about (one of the sections listed above, or "General")
 
 CRITICAL RULES:
 - DO NOT make up facts - only use information explicitly stated in the article
@@ -72,6 +97,7 @@ OUTPUT FORMAT (respond with valid JSON only):
       ],
       "answer": "Option B",
       "difficulty": "medium",
+      "section": "Section name",
       "explanation": "The article states in the [section name] that..."
     }}
   ]
@@ -80,7 +106,7 @@ OUTPUT FORMAT (respond with valid JSON only):
 Generate the quiz now:"""
 
         return PromptTemplate(
-            input_variables=["title", "content", "num_questions"],
+            input_variables=["title", "content", "sections", "existing_questions", "num_questions"],
             template=template
         )
 
@@ -119,7 +145,15 @@ Generate the related topics now:"""
             template=template
         )
 
-    def generate_quiz(self, title: str, content: str, num_questions: int = 7) -> List[Dict]:
+    def generate_quiz(
+        self,
+        title: str,
+        content: str,
+        num_questions: int = 7,
+        sections: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        allow_fallback: bool = True
+    ) -> List[Dict]:
         """
         Generate quiz questions from article content
         
@@ -127,18 +161,30 @@ Generate the related topics now:"""
             title: Article title
             content: Full article text
             num_questions: Number of questions to generate (default 7)
+            sections: Article section titles to spread questions across
+            exclude: Existing question texts that should not be repeated
+            allow_fallback: Return a placeholder quiz instead of raising when the
+                response is unusable (the question bank must never store it)
         
         Returns:
             List of question dictionaries
+        
+        Raises:
+            LLMSchedulerError: If the LLM is overloaded or unavailable
+            QuizGenerationError: If allow_fallback is False and no usable questions came back
         """
         try:
             # Create chain
             chain = LLMChain(llm=self.llm, prompt=self.quiz_prompt)
             
             # Generate quiz
-            result = chain.run(
+            result = self.scheduler.call(
+                chain.run,
+                priority=self.priority,
                 title=title,
                 content=content,
+                sections=', '.join(sections) if sections else 'General',
+                existing_questions='\n'.join(f'- {q}' for q in exclude) if exclude else 'None',
                 num_questions=num_questions
             )
             
@@ -164,16 +210,32 @@ Generate the related topics now:"""
                     if isinstance(q['options'], list) and len(q['options']) == 4:
                         # Ensure answer is one of the options
                         if q['answer'] in q['options']:
+                            q['difficulty'] = str(q['difficulty']).lower()
+                            q['section'] = q.get('section') or 'General'
                             validated_questions.append(q)
             
+            if not validated_questions:
+                raise QuizGenerationError("LLM response contained no valid questions")
+            
             return validated_questions
             
+        except LLMSchedulerError:
+            # Don't hide overload behind a one-question fallback quiz
+            raise
         except json.JSONDecodeError as e:
             print(f"JSON parsing error: {e}")
             print(f"Raw response: {result}")
+            if not allow_fallback:
+                raise QuizGenerationError(f"LLM response was not valid JSON: {e}") from e
+            return self._generate_fallback_quiz(title, content, num_questions)
+        except QuizGenerationError:
+            if not allow_fallback:
+                raise
             return self._generate_fallback_quiz(title, content, num_questions)
         except Exception as e:
             print(f"Error generating quiz: {e}")
+            if not allow_fallback:
+                raise QuizGenerationError(f"Error generating quiz: {e}") from e
             return self._generate_fallback_quiz(title, content, num_questions)
 
     def generate_related_topics(self, title: str, summary: str, sections: List[str]) -> List[str]:
@@ -187,6 +249,9 @@ Generate the related topics now:"""
         
         Returns:
             List of related topic names
+        
+        Raises:
+            LLMSchedulerError: If the LLM is overloaded or unavailable
         """
         try:
             # Create chain
@@ -194,7 +259,9 @@ Generate the related topics now:"""
             
             # Generate related topics
             sections_text = ', '.join(sections[:5])  # Use first 5 sections
-            result = chain.run(
+            result = self.scheduler.call(
+                chain.run,
+                priority=self.priority,
                 title=title,
                 summary=summary,
                 sections=sections_text
@@ -215,6 +282,9 @@ Generate the related topics now:"""
             
             return topics[:8]  # Limit to 8 topics
             
+        except LLMSchedulerError:
+            # Fallback topics would be stored permanently (and prefetched)
+            raise
         except Exception as e:
             print(f"Error generating related topics: {e}")
             return self._generate_fallback_topics(title, sections)
@@ -227,6 +297,7 @@ Generate the related topics now:"""
                 "options": [title, "Unknown", "Not specified", "Other"],
                 "answer": title,
                 "difficulty": "easy",
+                "section": "General",
                 "explanation": "This is the title of the article."
             }
         ]
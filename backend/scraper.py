@@ -1,9 +1,14 @@
 import requests
 from bs4 import BeautifulSoup
 from typing import Dict, List, Optional
+from urllib.parse import quote, unquote
+import hashlib
 import re
 
 
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+
+
 class WikipediaScraper:
     """Scrapes and extracts content from Wikipedia articles"""
 
@@ -24,30 +29,41 @@ class WikipediaScraper:
             }
             response = requests.get(self.url, headers=headers, timeout=10)
             response.raise_for_status()
-            
-            self.raw_html = response.text
-            self.soup = BeautifulSoup(self.raw_html, 'lxml')
-
-            # Extract components
-            title = self._extract_title()
-            summary = self._extract_summary()
-            sections = self._extract_sections()
-            key_entities = self._extract_entities()
-
-            return {
-                'title': title,
-                'summary': summary,
-                'sections': sections,
-                'key_entities': key_entities,
-                'raw_html': self.raw_html,
-                'full_text': self._extract_full_text()
-            }
+
+            return self.parse(response.text)
 
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to fetch Wikipedia page: {str(e)}")
         except Exception as e:
             raise Exception(f"Error scraping Wikipedia: {str(e)}")
 
+    def parse(self, html: str) -> Dict:
+        """
+        Extract article data from already fetched HTML
+        Returns: Same dictionary as scrape(), without any network access
+        """
+        self.raw_html = html
+        self.soup = BeautifulSoup(self.raw_html, 'lxml')
+
+        # Extract components
+        title = self._extract_title()
+        summary = self._extract_summary()
+        sections = self._extract_sections()
+        key_entities = self._extract_entities()
+        revision_id = self._extract_revision_id()
+        full_text = self._extract_full_text()
+
+        return {
+            'title': title,
+            'summary': summary,
+            'sections': sections,
+            'key_entities': key_entities,
+            'raw_html': self.raw_html,
+            'full_text': full_text,
+            'revision_id': revision_id,
+            'content_hash': compute_content_hash(full_text)
+        }
+
     def _extract_title(self) -> str:
         """Extract article title"""
         title_elem = self.soup.find('h1', class_='firstHeading')
@@ -55,6 +71,13 @@ class WikipediaScraper:
             return title_elem.get_text().strip()
         return "Unknown Title"
 
+    def _extract_revision_id(self) -> Optional[int]:
+        """Extract the revision id MediaWiki embeds in the page config"""
+        match = re.search(r'"wgRevisionId"\s*:\s*(\d+)', self.raw_html)
+        if match:
+            return int(match.group(1))
+        return None
+
     def _extract_summary(self) -> str:
         """Extract the first paragraph as summary"""
         # Find the first paragraph in the content area
@@ -164,6 +187,103 @@ class WikipediaScraper:
         return full_text
 
 
+def compute_content_hash(text: str) -> str:
+    """SHA-256 of the article text, used to detect edits that change the content"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def title_from_url(url: str) -> str:
+    """Convert a Wikipedia article URL into its page title"""
+    return unquote(url.split('/wiki/', 1)[-1]).replace('_', ' ')
+
+
+def article_url(title: str) -> str:
+    """Build the article URL for a page title (encoded like the frontend's encodeURIComponent)"""
+    return 'https://en.wikipedia.org/wiki/' + quote(title.strip().replace(' ', '_'), safe="!*'()")
+
+
+def _query_pages(titles: List[str], **params) -> Dict[str, Optional[Dict]]:
+    """
+    Run a MediaWiki API page query for several titles, 50 per request
+    Returns: Dictionary of title -> page data, following normalization and
+    redirects (None if the lookup failed)
+    """
+    pages = {title: None for title in titles}
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+
+    for start in range(0, len(titles), 50):
+        batch = titles[start:start + 50]
+
+        try:
+            response = requests.get(
+                WIKIPEDIA_API_URL,
+                params={
+                    'action': 'query',
+                    'titles': '|'.join(batch),
+                    'redirects': 1,
+                    'format': 'json',
+                    'formatversion': 2,
+                    **params
+                },
+                headers=headers,
+                timeout=10
+            )
+            response.raise_for_status()
+            data = response.json().get('query', {})
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error querying Wikipedia API: {e}")
+            continue
+
+        # Follow title normalization, then redirects, to the final page title
+        normalized = {item['from']: item['to'] for item in data.get('normalized', [])}
+        redirects = {item['from']: item['to'] for item in data.get('redirects', [])}
+        by_title = {page['title']: page for page in data.get('pages', []) if 'title' in page}
+
+        for title in batch:
+            resolved = normalized.get(title, title)
+            resolved = redirects.get(resolved, resolved)
+            pages[title] = by_title.get(resolved, {'title': resolved, 'missing': True})
+
+    return pages
+
+
+def fetch_latest_revision_ids(urls: List[str]) -> Dict[str, Optional[int]]:
+    """
+    Look up the current revision id of several articles via the MediaWiki API
+    Much cheaper than scraping: one request per 50 articles, no page HTML
+    Returns: Dictionary of url -> revision id (None if missing or lookup failed)
+    """
+    titles = {url: title_from_url(url) for url in urls}
+    pages = _query_pages(list(set(titles.values())), prop='revisions', rvprop='ids')
+
+    latest = {}
+    for url, title in titles.items():
+        page = pages.get(title)
+        latest[url] = page['revisions'][0]['revid'] if page and page.get('revisions') else None
+    return latest
+
+
+def resolve_article_titles(titles: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Resolve free-text topic names (e.g. LLM suggested related topics) to articles
+    Returns: Dictionary of topic -> canonical page title (None if there is no
+    such article, it is a disambiguation page, or the lookup failed)
+    """
+    titles = [title for title in titles if title and title.strip()]
+    pages = _query_pages(list(set(titles)), prop='pageprops', ppprop='disambiguation')
+
+    resolved = {}
+    for title in titles:
+        page = pages.get(title)
+        if not page or page.get('missing') or page.get('invalid') or 'disambiguation' in page.get('pageprops', {}):
+            resolved[title] = None
+        else:
+            resolved[title] = page['title']
+    return resolved
+
+
 def validate_wikipedia_url(url: str) -> bool:
     """Validate if the URL is a Wikipedia article"""
     pattern = r'^https?://(en\.)?wikipedia\.org/wiki/[^:]+$'
@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+
+
+class ResourceExhausted(Exception):
+    """Same name as google.api_core's 429 error, so it is classified as transient"""
+
+
+class ServiceUnavailable(Exception):
+    """Same name as google.api_core's 503 error, so it is classified as transient"""
+
+
+VALID_RESPONSE = json.dumps({
+    "questions": [
+        {
+            "question": "Who proposed the Turing test?",
+            "options": ["Alan Turing", "Alonzo Church", "John von Neumann", "Kurt Godel"],
+            "answer": "Alan Turing",
+            "difficulty": "easy",
+            "section": "Legacy",
+            "explanation": "The Legacy section names Turing as its author."
+        }
+    ]
+})
+
+
+class FaultInjectingLLM:
+    """
+    Local stand-in for an LLM call (e.g. chain.run) that fails on demand
+
+    Each call consumes the next fault from the script, then falls back to the
+    default. Faults:
+        ok          return the response
+        rate_limit  raise a 429 ResourceExhausted error
+        unavailable raise a 503 ServiceUnavailable error
+        slow        sleep for latency seconds, then return the response
+        bad_json    return text that is not JSON
+        error       raise a non-transient error
+        too_large   raise a 400 error whose message mentions quota-like numbers
+        bad_key     raise a 403 error whose message mentions quota
+    """
+
+    def __init__(self, script=None, default='ok', latency=1.0, response=VALID_RESPONSE):
+        self.script = list(script or [])
+        self.default = default
+        self.latency = latency
+        self.response = response
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+            fault = self.script.pop(0) if self.script else self.default
+
+        if fault == 'rate_limit':
+            raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if fault == 'unavailable':
+            raise ServiceUnavailable("503 The service is currently unavailable.")
+        if fault == 'slow':
+            time.sleep(self.latency)
+        if fault == 'bad_json':
+            return "Sure! Here is a quiz about the article."
+        if fault == 'error':
+            raise ValueError("400 Request contains an invalid argument.")
+        if fault == 'too_large':
+            raise ValueError("400 Request payload size exceeds the limit: 1500000 bytes.")
+        if fault == 'bad_key':
+            raise PermissionError("403 API key not valid; quota project not set.")
+        return self.response
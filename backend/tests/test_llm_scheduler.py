@@ -0,0 +1,205 @@
+import threading
+import time
+import unittest
+
+from llm_scheduler import (
+    LLMScheduler, CircuitOpenError, LLMUnavailableError, SchedulerRejectedError, is_transient_error
+)
+from tests.fault_injecting_llm import FaultInjectingLLM, ResourceExhausted, ServiceUnavailable, VALID_RESPONSE
+
+
+class FakeClock:
+    """Monotonic clock that only moves when the scheduler sleeps (or the test advances it)"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_scheduler(clock=None, **kwargs):
+    """Scheduler with a generous rate limit, driven by a fake clock unless one is given"""
+    options = dict(rate_per_second=1000, burst=1000, backoff_base=0.5, call_timeout=30)
+    if clock is not None:
+        options.update(clock=clock, sleep=clock.sleep)
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+def occupy_slot(scheduler, latency):
+    """Keep one slot busy with a slow call running in the background"""
+    thread = threading.Thread(target=scheduler.call, args=(FaultInjectingLLM(default='slow', latency=latency),))
+    thread.start()
+    deadline = time.monotonic() + 2
+    while scheduler.metrics()['in_flight'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return thread
+
+
+class RetryTest(unittest.TestCase):
+
+    def test_transient_errors_are_retried_until_success(self):
+        clock = FakeClock()
+        scheduler = make_scheduler(clock)
+        llm = FaultInjectingLLM(script=['unavailable', 'rate_limit'])
+
+        self.assertEqual(scheduler.call(llm), VALID_RESPONSE)
+        self.assertEqual(llm.calls, 3)
+        self.assertEqual(len(clock.sleeps), 2)  # One jittered backoff per retry
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['retries'], 2)
+        self.assertEqual(metrics['successes'], 1)
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = make_scheduler(FakeClock(), max_retries=2, breaker_threshold=10)
+        llm = FaultInjectingLLM(default='unavailable')
+
+        with self.assertRaises(LLMUnavailableError):
+            scheduler.call(llm)
+        self.assertEqual(llm.calls, 3)
+
+    def test_non_transient_errors_are_not_retried(self):
+        scheduler = make_scheduler(FakeClock())
+        llm = FaultInjectingLLM(script=['error'])
+
+        with self.assertRaises(ValueError):
+            scheduler.call(llm)
+        self.assertEqual(llm.calls, 1)
+
+    def test_client_errors_mentioning_limits_are_not_retried(self):
+        for fault, error in [('too_large', ValueError), ('bad_key', PermissionError)]:
+            scheduler = make_scheduler(FakeClock())
+            llm = FaultInjectingLLM(script=[fault])
+
+            with self.assertRaises(error):
+                scheduler.call(llm)
+            self.assertEqual(llm.calls, 1, fault)
+            self.assertEqual(scheduler.metrics()['retries'], 0, fault)
+
+    def test_bad_json_is_passed_through_for_the_caller_to_validate(self):
+        scheduler = make_scheduler(FakeClock())
+        self.assertNotEqual(scheduler.call(FaultInjectingLLM(script=['bad_json'])), VALID_RESPONSE)
+
+
+class TransientErrorTest(unittest.TestCase):
+
+    def test_classified_by_exception_type(self):
+        self.assertTrue(is_transient_error(ResourceExhausted("Resource has been exhausted")))
+        self.assertTrue(is_transient_error(ServiceUnavailable("")))
+        self.assertTrue(is_transient_error(TimeoutError()))
+        self.assertTrue(is_transient_error(ConnectionResetError()))
+
+    def test_only_a_leading_status_code_counts(self):
+        self.assertTrue(is_transient_error(ValueError("429 Too many requests")))
+        self.assertTrue(is_transient_error(ValueError(" 503 Service unavailable")))
+        self.assertFalse(is_transient_error(ValueError("400 Request payload size exceeds the limit: 1500000 bytes.")))
+        self.assertFalse(is_transient_error(ValueError("400 Input exceeds 5003 chars")))
+        self.assertFalse(is_transient_error(PermissionError("403 API key not valid; quota project not set.")))
+        self.assertFalse(is_transient_error(ValueError("Service unavailable, please retry")))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_open_half_open_closed(self):
+        clock = FakeClock()
+        scheduler = make_scheduler(clock, max_retries=5, breaker_threshold=3, breaker_reset_timeout=30)
+        llm = FaultInjectingLLM(default='unavailable')
+
+        # Third consecutive failure opens the circuit mid-call
+        with self.assertRaises(CircuitOpenError):
+            scheduler.call(llm)
+        self.assertEqual(llm.calls, 3)
+        self.assertEqual(scheduler.metrics()['circuit_state'], 'open')
+
+        # Open: fails fast without reaching the LLM
+        with self.assertRaises(CircuitOpenError):
+            scheduler.call(llm)
+        self.assertEqual(llm.calls, 3)
+
+        # After the reset timeout a single probe goes through and closes it
+        clock.now += 31
+        llm.default = 'ok'
+        self.assertEqual(scheduler.call(llm), VALID_RESPONSE)
+        self.assertEqual(scheduler.metrics()['circuit_state'], 'closed')
+
+    def test_failed_probe_reopens(self):
+        clock = FakeClock()
+        scheduler = make_scheduler(clock, max_retries=5, breaker_threshold=1, breaker_reset_timeout=30)
+        llm = FaultInjectingLLM(default='rate_limit')
+
+        with self.assertRaises(CircuitOpenError):
+            scheduler.call(llm)
+        clock.now += 31
+        with self.assertRaises(CircuitOpenError):
+            scheduler.call(llm)
+        self.assertEqual(llm.calls, 2)  # Only the probe reached the LLM
+        self.assertEqual(scheduler.metrics()['circuit_state'], 'open')
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_slow_call_exceeds_deadline(self):
+        scheduler = make_scheduler()
+        llm = FaultInjectingLLM(default='slow', latency=0.5)
+
+        with self.assertRaises(LLMUnavailableError):
+            scheduler.call(llm, timeout=0.1)
+        self.assertEqual(scheduler.metrics()['timeouts'], 1)
+
+    def test_rejected_while_waiting_for_a_slot(self):
+        scheduler = make_scheduler(initial_limit=1, max_limit=1)
+        busy = occupy_slot(scheduler, latency=0.5)
+
+        with self.assertRaises(SchedulerRejectedError):
+            scheduler.call(FaultInjectingLLM(), timeout=0.1)
+        self.assertEqual(scheduler.metrics()['rejected_deadline'], 1)
+        busy.join()
+
+    def test_rejected_when_rate_limit_exceeds_deadline(self):
+        scheduler = make_scheduler(FakeClock(), rate_per_second=0.1, burst=1)
+        llm = FaultInjectingLLM()
+
+        scheduler.call(llm)
+        with self.assertRaises(SchedulerRejectedError):
+            scheduler.call(llm, timeout=5)
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(scheduler.metrics()['rejected_rate_limited'], 1)
+
+
+class QueueTest(unittest.TestCase):
+
+    def test_rejected_when_queue_is_full(self):
+        scheduler = make_scheduler(initial_limit=1, max_limit=1, max_queue=0)
+        busy = occupy_slot(scheduler, latency=0.3)
+
+        with self.assertRaises(SchedulerRejectedError):
+            scheduler.call(FaultInjectingLLM())
+        self.assertEqual(scheduler.metrics()['rejected_queue_full'], 1)
+        busy.join()
+
+
+class AdaptiveLimitTest(unittest.TestCase):
+
+    def test_limit_halves_on_overload_and_grows_on_success(self):
+        scheduler = make_scheduler(FakeClock(), initial_limit=8, max_limit=8, breaker_threshold=10)
+        llm = FaultInjectingLLM(script=['rate_limit', 'rate_limit'])
+
+        scheduler.call(llm)
+        self.assertEqual(scheduler.metrics()['concurrency_limit'], 2.5)  # 8 -> 4 -> 2, then +1/2
+
+    def test_limit_never_drops_below_minimum(self):
+        scheduler = make_scheduler(FakeClock(), initial_limit=2, min_limit=1, max_retries=5, breaker_threshold=10)
+        llm = FaultInjectingLLM(script=['rate_limit'] * 4)
+
+        scheduler.call(llm)
+        self.assertEqual(scheduler.metrics()['concurrency_limit'], 2.0)  # Floor of 1, then +1
+
+
+if __name__ == '__main__':
+    unittest.main()
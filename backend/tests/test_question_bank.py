@@ -0,0 +1,195 @@
+import os
+import random
+import unittest
+from collections import Counter
+from datetime import datetime
+
+# The module-level engine in database.py must not need a Postgres driver
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, WikiQuiz, QuizQuestion
+from question_bank import QuestionBank
+
+
+def make_question(n, difficulty='medium', section='History'):
+    return {
+        'question': f"Question {n}?",
+        'options': ['A', 'B', 'C', 'D'],
+        'answer': 'A',
+        'difficulty': difficulty,
+        'section': section,
+        'explanation': f"Explanation {n}"
+    }
+
+
+class QuestionBankTestCase(unittest.TestCase):
+    """Question bank backed by an in-memory SQLite database"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.addCleanup(engine.dispose)
+        self.db = sessionmaker(bind=engine)()
+        self.addCleanup(self.db.close)
+
+        self.quiz = WikiQuiz(url="https://en.wikipedia.org/wiki/Alan_Turing", title="Alan Turing")
+        self.db.add(self.quiz)
+        self.db.commit()
+
+        self.bank = QuestionBank()
+        self.bank.quiz_size = 6
+        self.bank.low_water = 4
+        self.bank.max_size = 20
+        self.rng = random.Random(42)
+
+    def add(self, questions):
+        added = self.bank.add_questions(self.db, self.quiz, questions)
+        self.db.commit()
+        return added
+
+    def pool(self):
+        return self.db.query(QuizQuestion).filter(QuizQuestion.wiki_quiz_id == self.quiz.id).all()
+
+
+class SampleTest(QuestionBankTestCase):
+
+    def test_stratified_by_difficulty_then_section(self):
+        n = 0
+        for difficulty in ['hard', 'easy', 'medium']:
+            for section in ['Early life', 'Career']:
+                for _ in range(4):
+                    n += 1
+                    self.add([make_question(n, difficulty, section)])
+
+        quiz = self.bank.sample(self.db, self.quiz, rng=self.rng)
+
+        self.assertEqual(len(quiz), 6)
+        self.assertEqual([q['difficulty'] for q in quiz], ['easy'] * 2 + ['medium'] * 2 + ['hard'] * 2)
+        for difficulty in ['easy', 'medium', 'hard']:
+            sections = {q['section'] for q in quiz if q['difficulty'] == difficulty}
+            self.assertEqual(sections, {'Early life', 'Career'})
+
+    def test_uneven_strata_still_fill_the_quiz(self):
+        self.add([make_question(1, 'easy')] + [make_question(n, 'hard') for n in range(2, 10)])
+
+        quiz = self.bank.sample(self.db, self.quiz, rng=self.rng)
+
+        self.assertEqual(Counter(q['difficulty'] for q in quiz), {'easy': 1, 'hard': 5})
+
+    def test_same_seed_gives_the_same_quiz(self):
+        self.add([make_question(n, difficulty) for n, difficulty in enumerate(['easy', 'medium', 'hard'] * 5)])
+
+        first = self.bank.sample(self.db, self.quiz, rng=random.Random(7))
+        second = self.bank.sample(self.db, self.quiz, rng=random.Random(7))
+
+        self.assertEqual([q['id'] for q in first], [q['id'] for q in second])
+
+    def test_prefers_unseen_questions(self):
+        added = self.add([make_question(n) for n in range(10)])
+        seen_ids = {q.id for q in added[:4]}
+
+        quiz = self.bank.sample(self.db, self.quiz, seen_ids=seen_ids, rng=self.rng)
+
+        self.assertEqual(len(quiz), 6)
+        self.assertFalse(seen_ids & {q['id'] for q in quiz})
+
+    def test_fills_up_with_seen_questions(self):
+        added = self.add([make_question(n) for n in range(8)])
+        unseen_ids = {q.id for q in added[:2]}
+        seen_ids = {q.id for q in added[2:]}
+
+        quiz = self.bank.sample(self.db, self.quiz, seen_ids=seen_ids, rng=self.rng)
+        picked = {q['id'] for q in quiz}
+
+        self.assertEqual(len(quiz), 6)
+        self.assertTrue(unseen_ids <= picked)
+        self.assertEqual(len(picked & seen_ids), 4)
+
+    def test_small_pool_returns_every_question(self):
+        self.add([make_question(n) for n in range(3)])
+
+        self.assertEqual(len(self.bank.sample(self.db, self.quiz, rng=self.rng)), 3)
+
+
+class NeedsTopUpTest(QuestionBankTestCase):
+
+    def test_not_needed_while_enough_questions_are_unseen(self):
+        added = self.add([make_question(n) for n in range(6)])
+
+        self.assertFalse(self.bank.needs_top_up(self.db, self.quiz))
+        self.assertFalse(self.bank.needs_top_up(self.db, self.quiz, seen_ids=[q.id for q in added[:2]]))
+
+    def test_needed_below_low_water(self):
+        added = self.add([make_question(n) for n in range(6)])
+
+        self.assertTrue(self.bank.needs_top_up(self.db, self.quiz, seen_ids=[q.id for q in added[:3]]))
+
+    def test_not_needed_once_the_pool_reaches_max_size(self):
+        added = self.add([make_question(n) for n in range(6)])
+        self.bank.max_size = 6
+
+        self.assertFalse(self.bank.needs_top_up(self.db, self.quiz, seen_ids=[q.id for q in added]))
+
+    def test_unknown_seen_ids_are_ignored(self):
+        self.add([make_question(n) for n in range(6)])
+
+        self.assertFalse(self.bank.needs_top_up(self.db, self.quiz, seen_ids=[1000, 1001, 1002]))
+
+
+class AddQuestionsTest(QuestionBankTestCase):
+
+    def test_skips_questions_already_in_the_pool(self):
+        self.add([make_question(1), make_question(2)])
+
+        duplicate = make_question(1)
+        duplicate['question'] = "  QUESTION 1?  "
+        added = self.add([duplicate, make_question(3)])
+
+        self.assertEqual([q.question for q in added], ["Question 3?"])
+        self.assertEqual(len(self.pool()), 3)
+
+    def test_skips_duplicates_within_a_batch(self):
+        added = self.add([make_question(1), make_question(1), make_question(2)])
+
+        self.assertEqual(len(added), 2)
+
+    def test_defaults_for_missing_difficulty_and_section(self):
+        question = make_question(1)
+        del question['difficulty']
+        question['section'] = None
+
+        added = self.add([question])
+
+        self.assertEqual((added[0].difficulty, added[0].section), ('medium', 'General'))
+
+
+class EnsurePoolTest(QuestionBankTestCase):
+
+    def test_seeds_legacy_quiz_without_touching_updated_at(self):
+        checked_at = datetime(2024, 1, 1, 12, 0)
+        self.quiz.quiz = [make_question(n) for n in range(5)]  # Stored before questions had ids
+        self.quiz.updated_at = checked_at
+        self.db.commit()
+
+        self.bank.ensure_pool(self.db, self.quiz)
+        self.db.expire_all()
+
+        self.assertEqual(len(self.pool()), 5)
+        self.assertTrue(all(q['id'] is not None for q in self.quiz.quiz))
+        self.assertEqual(self.quiz.updated_at, checked_at)
+
+    def test_leaves_an_existing_pool_alone(self):
+        self.add([make_question(n) for n in range(3)])
+        self.quiz.quiz = [make_question(n) for n in range(10, 15)]
+        self.db.commit()
+
+        self.bank.ensure_pool(self.db, self.quiz)
+
+        self.assertEqual(len(self.pool()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()